@@ -7,11 +7,30 @@ A collection of useful Python code snippets and examples
 import os
 import sys
 import json
+import re
 import datetime
-from typing import List, Dict, Optional, Union
+import gc
+import heapq
+import mmap
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress, count
+from math import gcd, isqrt, lcm, log, prod
+from multiprocessing import shared_memory
+from typing import List, Dict, Iterable, Iterator, Optional, TextIO, Tuple, Union
 from dataclasses import dataclass
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:  # NumPy accelerates the counting functions; fibonacci_batch needs it
+    np = None
+
 
 # ============= DATA STRUCTURES =============
 
@@ -63,51 +82,1717 @@ class Calculator:
 
 # ============= UTILITY FUNCTIONS =============
 
-def fibonacci(n: int) -> List[int]:
-    """Generate Fibonacci sequence up to n terms"""
-    if n <= 0:
-        return []
-    elif n == 1:
-        return [0]
-    elif n == 2:
-        return [0, 1]
-    
-    fib = [0, 1]
-    for i in range(2, n):
-        fib.append(fib[i-1] + fib[i-2])
-    return fib
+def fibonacci(n: int, use_cache: bool = False,
+              compact: bool = False) -> Union[List[int], 'CompactFibonacci']:
+    """Generate Fibonacci sequence up to n terms
+
+    With use_cache=True the terms are sliced from the shared fibonacci_cache.
+    With compact=True they come back as a CompactFibonacci instead of a list.
+    """
+    if compact:
+        return CompactFibonacci(n, use_cache)
+    if use_cache:
+        return fibonacci_cache.prefix(n)
+    return list(FibonacciSequence(n))
+
+
+class CompactFibonacci(Sequence):
+    """The first n Fibonacci numbers, with the terms below 2**64 in an array('Q')
+
+    Only the tail past F(93) is kept as a list of Python ints.
+    """
+
+    def __init__(self, n: int, use_cache: bool = False):
+        n = max(n, 0)
+        split = min(n, _FIB_UINT64_MAX_INDEX + 1)
+        if use_cache:
+            terms = fibonacci_cache.prefix(n)
+            self.head, self.tail = array('Q', terms[:split]), terms[split:]
+        else:
+            self.head = array('Q', FibonacciSequence(split))
+            self.tail = FibonacciSequence(n)[split:]
+
+    def __len__(self) -> int:
+        return len(self.head) + len(self.tail)
+
+    def __iter__(self):
+        yield from self.head
+        yield from self.tail
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CompactFibonacci index out of range")
+        head = self.head
+        return head[index] if index < len(head) else self.tail[index - len(head)]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (CompactFibonacci, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"CompactFibonacci({len(self)})"
+
+    def nbytes(self) -> int:
+        """Bytes held by the terms, counting the tail ints and their list"""
+        return (len(self.head) * self.head.itemsize
+                + sys.getsizeof(self.tail) + sum(sys.getsizeof(term) for term in self.tail))
+
+
+def _fibonacci_pair(n: int) -> Tuple[int, int]:
+    """(F(n), F(n+1)) by fast doubling over the bits of n"""
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        # F(2k) = F(k)(2F(k+1) - F(k)), F(2k+1) = F(k)^2 + F(k+1)^2
+        c = a * ((b << 1) - a)
+        d = a * a + b * b
+        a, b = (d, c + d) if bit == '1' else (c, d)
+    return a, b
+
+
+def fibonacci_nth(n: int) -> int:
+    """The n-th Fibonacci number, F(0) = 0; equal to fibonacci(n + 1)[-1]"""
+    if n < 0:
+        raise ValueError("Index must be non-negative")
+    # The last doubling step dominates; only half of it is needed here
+    a, b = _fibonacci_pair(n >> 1)
+    return a * a + b * b if n & 1 else a * ((b << 1) - a)
+
+
+class FibonacciSequence(Sequence):
+    """Lazy view of the first n Fibonacci numbers, F(0) = 0
+
+    Nothing is stored: an index is answered by fast doubling, and a slice
+    seeds its first term that way and then runs forward.
+    """
+
+    def __init__(self, n: int):
+        self.n = max(n, 0)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __iter__(self):
+        return self._run(0, self.n)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = range(self.n)[index]
+            if not indices:
+                return []
+            if indices.step < 0:
+                return list(self._run(indices[-1], indices[0] + 1, -indices.step))[::-1]
+            return list(self._run(indices.start, indices.stop, indices.step))
+        if index < 0:
+            index += self.n
+        if not 0 <= index < self.n:
+            raise IndexError("FibonacciSequence index out of range")
+        return fibonacci_nth(index)
+
+    def __repr__(self) -> str:
+        return f"FibonacciSequence({self.n})"
+
+    @staticmethod
+    def _run(start: int, stop: int, step: int = 1):
+        """Yield F(start), F(start + step), ... below index stop"""
+        if start >= stop:
+            return
+        a, b = _fibonacci_pair(start)
+        i = start
+        while True:
+            yield a
+            i += step
+            if i >= stop:
+                return
+            if step == 1:
+                a, b = b, a + b
+            else:
+                for _ in range(step):
+                    a, b = b, a + b
+
+
+class FibonacciCache:
+    """Process-wide prefix F(0), F(1), ... that is extended only as far as asked
+
+    Terms past max_bytes of storage are still computed for the caller but not
+    kept, so the big tail never pins memory. hits and misses count requests
+    served entirely from the stored prefix and requests that extended it.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._terms: List[int] = []
+        self._nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def prefix(self, n: int) -> List[int]:
+        """The first n Fibonacci numbers, extending the stored prefix if needed
+
+        n <= 0 gives [] and counts as a hit, like any request the prefix covers.
+        """
+        n = max(n, 0)
+        with self._lock:
+            terms = self._terms
+            if n <= len(terms):
+                self.hits += 1
+                return terms[:n]
+            self.misses += 1
+            result = terms[:]
+            a, b = _fibonacci_pair(len(terms))
+            storing = True
+            for _ in range(n - len(terms)):
+                result.append(a)
+                if storing:
+                    size = sys.getsizeof(a)
+                    if self._nbytes + size > self.max_bytes:
+                        storing = False
+                    else:
+                        terms.append(a)
+                        self._nbytes += size
+                a, b = b, a + b
+            return result
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Change the memory cap, dropping the tail that no longer fits"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            terms = self._terms
+            while terms and self._nbytes > max_bytes:
+                self._nbytes -= sys.getsizeof(terms.pop())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._terms = []
+            self._nbytes = 0
+            self.hits = self.misses = 0
+
+
+fibonacci_cache = FibonacciCache()
+
+
+def _fibonacci_pair_mod(n: int, m: int) -> Tuple[int, int]:
+    """(F(n) mod m, F(n+1) mod m) by fast doubling over the bits of n"""
+    a, b = 0, 1 % m
+    for bit in bin(n)[2:]:
+        # F(2k) = F(k)(2F(k+1) - F(k)), F(2k+1) = F(k)^2 + F(k+1)^2
+        c = a * (2 * b - a) % m
+        d = (a * a + b * b) % m
+        a, b = (d, (c + d) % m) if bit == '1' else (c, d)
+    return a, b
+
+
+# Pisano periods found so far, by modulus
+_pisano_periods: Dict[int, int] = {}
+
+
+def pisano_period(m: int) -> int:
+    """Period of the Fibonacci numbers mod m, computed from the factorization of m
+
+    pi(p) divides p - 1 or 2(p + 1) for primes p other than 2 and 5, and
+    pi(p**k) is taken as p**(k-1) pi(p); the combined period is checked
+    before it is cached.
+    """
+    if m < 1:
+        raise ValueError("Modulus must be positive")
+    period = _pisano_periods.get(m)
+    if period is not None:
+        return period
+    period = 1
+    factors = factorize(m)
+    for p in set(factors):
+        if p == 2 or p == 5:
+            prime_period = 3 if p == 2 else 20
+        else:
+            prime_period = p - 1 if p % 10 in (1, 9) else 2 * (p + 1)
+            for q in set(factorize(prime_period)):
+                while prime_period % q == 0 and _fibonacci_pair_mod(prime_period // q, p) == (0, 1):
+                    prime_period //= q
+        period = lcm(period, prime_period * p ** (factors.count(p) - 1))
+    if _fibonacci_pair_mod(period, m) != (0, 1 % m):
+        raise ArithmeticError(f"Could not determine the Pisano period of {m}")
+    _pisano_periods[m] = period
+    return period
+
+
+def fibonacci_mod(n: int, m: int, use_pisano: bool = False) -> int:
+    """F(n) mod m in O(log n) steps, with F(0) = 0 as in fibonacci()
+
+    With use_pisano=True n is first reduced modulo the (cached) Pisano period
+    of m, which pays off when many queries share a modulus.
+    """
+    if n < 0:
+        raise ValueError("Index must be non-negative")
+    if m < 1:
+        raise ValueError("Modulus must be positive")
+    if use_pisano:
+        n %= pisano_period(m)
+    return _fibonacci_pair_mod(n, m)[0]
+
+
+def fibonacci_mod_many(queries: Iterable[Tuple[int, int]], use_pisano: bool = False) -> List[int]:
+    """F(n) mod m for many (n, m) pairs
+
+    use_pisano is passed on to fibonacci_mod; each distinct modulus is then
+    factorized once and its period cached.
+    """
+    return [fibonacci_mod(n, m, use_pisano) for n, m in queries]
+
+
+def _fibonacci_chunk(start: int, stop: int) -> List[int]:
+    """Worker: F(start) .. F(stop - 1), seeded by fast doubling"""
+    return FibonacciSequence(stop)[start:stop]
+
+
+def _fibonacci_chunk_text(start: int, stop: int) -> str:
+    """Worker: F(start) .. F(stop - 1) in decimal, one term per line"""
+    return ''.join(f"{term}\n" for term in _fibonacci_chunk(start, stop))
+
+
+def _unlimited_int_digits() -> None:
+    """Pool initializer: lift the int-to-str digit limit for long terms"""
+    if hasattr(sys, 'set_int_max_str_digits'):
+        sys.set_int_max_str_digits(0)
+
+
+def _ordered_chunks(pool: ProcessPoolExecutor, func, n: int, chunk_size: int,
+                    workers: int) -> Iterator:
+    """Run func(start, stop) over [0, n) in chunks and yield the results in order
+
+    At most two chunks per worker are in flight, which bounds memory.
+    """
+    pending = deque()
+    for start in range(0, n, chunk_size):
+        pending.append(pool.submit(func, start, min(start + chunk_size, n)))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def fibonacci_chunks(n: int, chunk_size: int = 10000, workers: int = 1) -> Iterator[List[int]]:
+    """Generator for the first n Fibonacci numbers as consecutive lists of chunk_size terms
+
+    Each chunk is seeded independently by fast doubling, so with workers > 1
+    the chunks are generated in a process pool and still come back in order.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    if workers <= 1:
+        for start in range(0, n, chunk_size):
+            yield _fibonacci_chunk(start, min(start + chunk_size, n))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from _ordered_chunks(pool, _fibonacci_chunk, n, chunk_size, workers)
+
+
+def _write_chunks(out: Union[str, Path, TextIO], chunks: Iterable[str]) -> None:
+    """Write text chunks in order to a path or an open text file"""
+    if hasattr(out, 'write'):
+        for text in chunks:
+            out.write(text)
+    else:
+        with open(out, 'w', encoding='utf-8') as file:
+            for text in chunks:
+                file.write(text)
+
+
+def write_fibonacci(out: Union[str, Path, TextIO], n: int, chunk_size: int = 1000,
+                    workers: int = 1) -> int:
+    """Write the first n Fibonacci numbers to a path or text file, one per line
+
+    With workers > 1 the workers also do the decimal conversion, which
+    dominates for long terms; the chunks are written in order as they
+    complete. Returns n.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    n = max(n, 0)
+    if workers <= 1:
+        # Long terms exceed the int-to-str digit limit; lift it only while writing
+        digit_limit = None
+        if hasattr(sys, 'get_int_max_str_digits'):
+            digit_limit = sys.get_int_max_str_digits()
+        if digit_limit is not None:
+            sys.set_int_max_str_digits(0)
+        try:
+            _write_chunks(out, (_fibonacci_chunk_text(start, min(start + chunk_size, n))
+                                for start in range(0, n, chunk_size)))
+        finally:
+            if digit_limit is not None:
+                sys.set_int_max_str_digits(digit_limit)
+        return n
+    with ProcessPoolExecutor(max_workers=workers, initializer=_unlimited_int_digits) as pool:
+        _write_chunks(out, _ordered_chunks(pool, _fibonacci_chunk_text, n, chunk_size, workers))
+    return n
+
+
+# F(93) is the last Fibonacci number below 2**64
+_FIB_UINT64_MAX_INDEX = 93
+_fib_uint64: Optional['np.ndarray'] = None
+
+
+def fibonacci_batch(indices, overflow: str = 'raise') -> 'np.ndarray':
+    """F(i) for every index in an array, by one gather from a uint64 lookup table
+
+    Indices above 93 do not fit in uint64: overflow='raise' raises
+    OverflowError, overflow='object' returns an object array of exact ints.
+    """
+    global _fib_uint64
+    if np is None:
+        raise ImportError("fibonacci_batch requires NumPy")
+    if overflow not in ('raise', 'object'):
+        raise ValueError(f"Unknown overflow mode {overflow!r}")
+    if _fib_uint64 is None:
+        _fib_uint64 = np.array(fibonacci(_FIB_UINT64_MAX_INDEX + 1), dtype=np.uint64)
+    indices = np.asarray(indices)
+    if indices.size == 0:
+        return np.zeros(indices.shape, dtype=np.uint64)
+    if indices.dtype.kind not in 'iu':
+        raise TypeError("Fibonacci indices must be integers")
+    if indices.min() < 0:
+        raise ValueError("Index must be non-negative")
+    if indices.max() <= _FIB_UINT64_MAX_INDEX:
+        return _fib_uint64[indices]
+    too_big = indices > _FIB_UINT64_MAX_INDEX
+    if overflow == 'raise':
+        raise OverflowError(f"F({int(indices[too_big][0])}) does not fit in uint64")
+    result = _fib_uint64[np.where(too_big, 0, indices)].astype(object)
+    result[too_big] = [fibonacci_nth(int(i)) for i in indices[too_big]]
+    return result
+
+
+# Odd primes below 1000, used for trial division of small inputs
+_TRIAL_PRIMES = tuple(p for p in range(3, 1000, 2) if all(p % d for d in range(3, isqrt(p) + 1, 2)))
+
+# The first twelve primes are a deterministic Miller-Rabin witness set below 2**64
+_MR_WITNESSES_64 = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+
+
+def _is_strong_probable_prime(n: int, base: int) -> bool:
+    """Miller-Rabin round: is the odd number n a strong probable prime to base"""
+    s = ((n - 1) & (1 - n)).bit_length() - 1
+    d = (n - 1) >> s
+    x = pow(base, d, n)
+    if x == 1 or x == n - 1:
+        return True
+    for _ in range(s - 1):
+        x = x * x % n
+        if x == n - 1:
+            return True
+    return False
+
+
+def _jacobi(a: int, n: int) -> int:
+    """Jacobi symbol (a/n) for odd positive n"""
+    a %= n
+    result = 1
+    while a:
+        while not a & 1:
+            a >>= 1
+            if n & 7 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a & 3 == 3 and n & 3 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def _is_strong_lucas_probable_prime(n: int) -> bool:
+    """Strong Lucas test with Selfridge's parameters for odd n free of small factors"""
+    if isqrt(n) ** 2 == n:
+        return False
+    D = 5
+    while True:
+        jacobi = _jacobi(D, n)
+        if jacobi == -1:
+            break
+        if jacobi == 0:
+            return False
+        D = -D - 2 if D > 0 else -D + 2
+    P, Q = 1, (1 - D) // 4
+    s = ((n + 1) & -(n + 1)).bit_length() - 1
+    d = (n + 1) >> s
+
+    def half(x: int) -> int:
+        x %= n
+        return (x + n) // 2 if x & 1 else x // 2
+
+    U, V, Qk = 1, P, Q % n
+    for bit in bin(d)[3:]:
+        U, V = U * V % n, (V * V - 2 * Qk) % n
+        Qk = Qk * Qk % n
+        if bit == '1':
+            U, V = half(P * U + V), half(D * U + P * V)
+            Qk = Qk * Q % n
+    if U == 0 or V == 0:
+        return True
+    for _ in range(s - 1):
+        V = (V * V - 2 * Qk) % n
+        if V == 0:
+            return True
+        Qk = Qk * Qk % n
+    return False
 
 
 def is_prime(num: int) -> bool:
-    """Check if a number is prime"""
+    """Check if a number is prime
+
+    Values under the prime_cache bound are looked up; otherwise small inputs
+    use trial division, inputs below 2**64 a deterministic Miller-Rabin test
+    and anything larger the Baillie-PSW test.
+    """
     if num < 2:
         return False
-    if num == 2:
+    cached = prime_cache.lookup(num)
+    if cached is not None:
+        return cached
+    if num < 4:
         return True
     if num % 2 == 0:
         return False
-    
-    for i in range(3, int(num ** 0.5) + 1, 2):
-        if num % i == 0:
+    for p in _TRIAL_PRIMES:
+        if p * p > num:
+            return True
+        if num % p == 0:
+            return False
+    return _is_probable_prime(num)
+
+
+def _is_probable_prime(num: int) -> bool:
+    """Strong primality test for odd num without prime factors below 1000"""
+    if num < 1 << 64:
+        return all(_is_strong_probable_prime(num, base) for base in _MR_WITNESSES_64)
+    return _is_strong_probable_prime(num, 2) and _is_strong_lucas_probable_prime(num)
+
+
+# Odd numbers per sieve segment: a 256 KiB bytearray stays resident in L2
+_SEGMENT_SIZE = 1 << 18
+
+
+def _small_primes(limit: int) -> List[int]:
+    """Plain sieve of Eratosthenes for the base primes up to limit"""
+    if limit < 2:
+        return []
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0] = sieve[1] = 0
+    for p in range(2, isqrt(limit) + 1):
+        if sieve[p]:
+            sieve[p * p::p] = bytes(len(range(p * p, limit + 1, p)))
+    return list(compress(range(limit + 1), sieve))
+
+
+def _sieve_segment(lo: int, hi: int, base_primes: List[int]) -> bytearray:
+    """Sieve the odd numbers in [lo, hi); byte i stands for (lo | 1) + 2*i
+
+    base_primes must hold the odd primes up to isqrt(hi - 1).
+    """
+    start = lo | 1
+    size = max(0, (hi - start + 1) // 2)
+    segment = bytearray([1]) * size
+    for p in base_primes:
+        square = p * p
+        if square >= hi:
+            break
+        first = max(square, (start + p - 1) // p * p)
+        if not first & 1:
+            first += p
+        index = (first - start) // 2
+        segment[index::p] = bytes(len(range(index, size, p)))
+    if start == 1 and size:
+        segment[0] = 0
+    return segment
+
+
+def find_primes(limit: int, compact: bool = False, workers: int = 1) -> Union[List[int], array]:
+    """Find all prime numbers up to the given limit with a segmented sieve
+
+    With compact=True the primes come back as an array('Q') instead of a list.
+    With workers > 1 the segments are sieved in parallel into a shared bitmap.
+    Single-worker calls are served from (and grow) the shared prime_cache.
+    """
+    if workers > 1:
+        primes = array('Q') if compact else []
+        if limit >= 2:
+            primes.extend(PrimeBitmap(limit, workers=workers))
+        return primes
+    return prime_cache.primes_between(2, limit + 1, compact)
+
+
+def _pack_bits(flags: bytes) -> bytes:
+    """Pack one 0/1 byte per flag into one bit per flag, lowest bit first"""
+    size = (len(flags) + 7) // 8
+    flags = bytes(flags) + bytes(8 * size - len(flags))
+    value = 0
+    for k in range(8):
+        value |= int.from_bytes(flags[k::8], 'little') << k
+    return value.to_bytes(size, 'little')
+
+
+def _unpack_bits(packed: bytes) -> bytearray:
+    """Expand packed bits back into one 0/1 byte per flag"""
+    size = len(packed)
+    value = int.from_bytes(packed, 'little')
+    ones = int.from_bytes(b'\x01' * size, 'little')
+    flags = bytearray(8 * size)
+    for k in range(8):
+        flags[k::8] = ((value >> k) & ones).to_bytes(size, 'little')
+    return flags
+
+
+def _sieve_into_shared(name: str, lo: int, hi: int, base_primes: List[int]) -> None:
+    """Worker: sieve [lo, hi) and write the packed bits into a shared bitmap
+
+    lo must be 1 mod 16 so the range starts on a byte boundary of the bitmap.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        span = 2 * _SEGMENT_SIZE
+        for seg_lo in range(lo, hi, span):
+            packed = _pack_bits(_sieve_segment(seg_lo, min(seg_lo + span, hi), base_primes))
+            offset = seg_lo // 16
+            shm.buf[offset:offset + len(packed)] = packed
+    finally:
+        shm.close()
+
+
+def _parallel_prime_bits(limit: int, workers: int) -> bytearray:
+    """Build the odd-only prime bitmap up to limit across a process pool"""
+    size = ((limit + 1) // 2 + 7) // 8
+    base_primes = _small_primes(isqrt(limit))[1:]
+    step = 2 * _SEGMENT_SIZE
+    # A few ranges per worker keeps the pool balanced near the end
+    span = max(step, -(-limit // (4 * workers * step)) * step)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_sieve_into_shared, shm.name, lo, min(lo + span, limit + 1),
+                            base_primes)
+                for lo in range(1, limit + 1, span)
+            ]
+            for future in futures:
+                future.result()
+        return bytearray(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+# Header of a saved PrimeBitmap: magic, format version, reserved, limit
+_BITMAP_HEADER = struct.Struct('<4sHHQ')
+_BITMAP_MAGIC = b'PBMP'
+_BITMAP_VERSION = 1
+
+
+class PrimeBitmap:
+    """Odd-only prime table: bit i of the bitmap marks whether 2*i + 1 is prime"""
+
+    def __init__(self, limit: int, bits: Optional[bytes] = None, workers: int = 1):
+        self.limit = max(limit, 1)
+        size = ((self.limit + 1) // 2 + 7) // 8
+        if bits is None and workers > 1:
+            bits = _parallel_prime_bits(self.limit, workers)
+        elif bits is None:
+            bits = bytearray()
+            base_primes = _small_primes(isqrt(self.limit))[1:]
+            span = 2 * _SEGMENT_SIZE
+            for lo in range(1, self.limit + 1, span):
+                hi = min(lo + span, self.limit + 1)
+                bits += _pack_bits(_sieve_segment(lo, hi, base_primes))
+        elif len(bits) != size:
+            raise ValueError(f"Expected {size} bytes for limit {self.limit}, got {len(bits)}")
+        self.bits = bits
+
+    @classmethod
+    def from_bytes(cls, data: bytes, limit: int) -> 'PrimeBitmap':
+        return cls(limit, bytearray(data))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.bits)
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Write the bitmap to path behind a versioned header, for load()"""
+        with open(path, 'wb') as file:
+            file.write(_BITMAP_HEADER.pack(_BITMAP_MAGIC, _BITMAP_VERSION, 0, self.limit))
+            file.write(self.bits)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'PrimeBitmap':
+        """Open a saved bitmap read-only with mmap, without copying the bits
+
+        Lookups go straight to the mapped pages, so processes that load the
+        same file share one copy in the page cache.
+        """
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(mapped) < _BITMAP_HEADER.size:
+                raise ValueError(f"{path} is too short for a prime bitmap")
+            magic, version, _, limit = _BITMAP_HEADER.unpack_from(mapped)
+            if magic != _BITMAP_MAGIC:
+                raise ValueError(f"{path} is not a prime bitmap")
+            if version != _BITMAP_VERSION:
+                raise ValueError(f"Unsupported prime bitmap version {version} in {path}")
+            size = ((max(limit, 1) + 1) // 2 + 7) // 8
+            if len(mapped) != _BITMAP_HEADER.size + size:
+                raise ValueError(f"{path} is truncated: expected {size} bytes of bits "
+                                 f"for limit {limit}")
+        except Exception:
+            mapped.close()
+            raise
+        bitmap = cls(limit, memoryview(mapped)[_BITMAP_HEADER.size:])
+        bitmap._mapped = mapped
+        return bitmap
+
+    def close(self) -> None:
+        """Release the mapping of a bitmap opened with load()"""
+        mapped = getattr(self, '_mapped', None)
+        if mapped is not None:
+            self.bits.release()
+            self.bits = bytearray()
+            self.limit = 1
+            mapped.close()
+            self._mapped = None
+
+    def __enter__(self) -> 'PrimeBitmap':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def is_prime(self, num: int) -> bool:
+        if num > self.limit:
+            raise ValueError(f"{num} is beyond the bitmap limit {self.limit}")
+        if num < 3:
+            return num == 2
+        return bool(num & 1 and self.bits[num >> 4] >> ((num >> 1) & 7) & 1)
+
+    def __contains__(self, num: int) -> bool:
+        return num <= self.limit and self.is_prime(num)
+
+    def __iter__(self):
+        if self.limit >= 2:
+            yield 2
+        chunk = _SEGMENT_SIZE // 8
+        for offset in range(0, len(self.bits), chunk):
+            flags = _unpack_bits(self.bits[offset:offset + chunk])
+            start = 16 * offset + 1
+            yield from compress(range(start, start + 2 * len(flags), 2), flags)
+
+    def count(self) -> int:
+        """Number of primes up to the bitmap limit"""
+        chunk = _SEGMENT_SIZE // 8
+        total = int(self.limit >= 2)
+        for offset in range(0, len(self.bits), chunk):
+            total += bin(int.from_bytes(self.bits[offset:offset + chunk], 'little')).count('1')
+        return total
+
+
+# Residues mod 2*3*5*7 that can hold a prime above 7
+_WHEEL_210 = bytes(gcd(r, 210) == 1 for r in range(210))
+
+# Product of the trial primes from 11 up, for a one-shot small-factor gcd
+_TRIAL_PRIMORIAL = prod(p for p in _TRIAL_PRIMES if p > 7)
+
+# Bound of the shared bitmap that answers is_prime_many for small values
+_PRIME_BITMAP_LIMIT = 1 << 21
+_prime_bitmap: Optional[PrimeBitmap] = None
+
+
+def is_prime_many(numbers: Iterable[int]) -> bytearray:
+    """Check many numbers at once; byte i of the result is 1 if the i-th number is prime"""
+    global _prime_bitmap
+    if _prime_bitmap is None:
+        _prime_bitmap = PrimeBitmap(_PRIME_BITMAP_LIMIT)
+    limit, bits = _prime_bitmap.limit, _prime_bitmap.bits
+    wheel, primorial = _WHEEL_210, _TRIAL_PRIMORIAL
+    result = bytearray()
+    append = result.append
+    for num in numbers:
+        if num <= limit:
+            if num < 3:
+                append(num == 2)
+            else:
+                append(num & 1 and bits[num >> 4] >> ((num >> 1) & 7) & 1)
+        elif not wheel[num % 210] or gcd(num, primorial) != 1:
+            append(0)
+        else:
+            append(_is_probable_prime(num))
+    return result
+
+
+class PrimeCache:
+    """Sorted table of the primes up to a bound that grows on demand
+
+    The sieve is extended lazily, at least doubling its bound each time, and
+    never past max_bytes of storage. Readers work on an immutable snapshot of
+    (limit, primes), so only growth and eviction take the lock.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._state = (1, array('Q'))
+
+    @property
+    def limit(self) -> int:
+        return self._state[0]
+
+    def nbytes(self) -> int:
+        primes = self._state[1]
+        return len(primes) * primes.itemsize
+
+    @staticmethod
+    def _estimate_bytes(limit: int) -> float:
+        # Rosser-Schoenfeld: pi(x) < 1.25506 x / ln x
+        return 8 * 1.25506 * limit / log(limit) if limit > 1 else 0
+
+    def ensure(self, limit: int) -> bool:
+        """Grow the table to cover limit; False if that would exceed max_bytes"""
+        if limit <= self._state[0]:
+            return True
+        if self._estimate_bytes(limit) > self.max_bytes:
             return False
-    return True
+        with self._lock:
+            old_limit, primes = self._state
+            if limit <= old_limit:
+                return True
+            new_limit = max(limit, 2 * old_limit, 1 << 16)
+            if self._estimate_bytes(new_limit) > self.max_bytes:
+                new_limit = limit
+            grown = array('Q', primes)
+            grown.extend(iter_primes(old_limit + 1, new_limit + 1))
+            self._state = (new_limit, grown)
+        return True
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Change the memory cap, evicting the upper range that no longer fits"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            limit, primes = self._state
+            keep = max_bytes // primes.itemsize
+            if keep < len(primes):
+                self._state = (primes[keep] - 1, primes[:keep])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._state = (1, array('Q'))
+
+    def lookup(self, num: int) -> Optional[bool]:
+        """Answer is_prime(num) from the table, or None when num is beyond it"""
+        limit, primes = self._state
+        if num > limit:
+            return None
+        index = bisect_left(primes, num)
+        return index < len(primes) and primes[index] == num
+
+    def count_upto(self, num: int) -> Optional[int]:
+        """Number of primes <= num from the table, or None when num is beyond it"""
+        limit, primes = self._state
+        if num > limit:
+            return None
+        return bisect_left(primes, num + 1)
+
+    def primes_between(self, lo: int, hi: int, compact: bool = False) -> Union[List[int], array]:
+        """Primes p with lo <= p < hi, from the table whenever hi fits under the cap"""
+        self.ensure(hi - 1)
+        limit, primes = self._state
+        if hi - 1 <= limit:
+            found = primes[bisect_left(primes, lo):bisect_left(primes, hi)]
+            return found if compact else found.tolist()
+        if compact:
+            return array('Q', iter_primes(lo, hi))
+        return list(iter_primes(lo, hi))
+
+
+prime_cache = PrimeCache()
+
+
+def _lucy_prime_count(n: int, base_primes: array) -> int:
+    """Lucy_Hedgehog DP over the values n // i, in pure Python
+
+    small[v] and large[i] hold the count of numbers in [2, v] and [2, n // i]
+    that survive sieving by the primes processed so far.
+    """
+    r = isqrt(n)
+    small = [v - 1 for v in range(r + 1)]
+    large = [0] + [n // i - 1 for i in range(1, r + 1)]
+    for p in base_primes:
+        square = p * p
+        if square > n:
+            break
+        c = small[p - 1]
+        top = min(r, n // square)
+        split = min(top, r // p)
+        for i in range(1, split + 1):
+            large[i] -= large[i * p] - c
+        for i in range(split + 1, top + 1):
+            large[i] -= small[n // (i * p)] - c
+        for v in range(r, square - 1, -1):
+            small[v] -= small[v // p] - c
+    return large[1]
+
+
+def _lucy_prime_count_numpy(n: int, base_primes: array) -> int:
+    """Vectorized Lucy_Hedgehog DP; n must stay well inside int64"""
+    r = isqrt(n)
+    values = np.arange(r + 1, dtype=np.int64)
+    quotients = n // np.maximum(values, 1)
+    small = values - 1
+    large = quotients - 1
+    for p in base_primes:
+        square = p * p
+        if square > n:
+            break
+        c = small[p - 1]
+        top = min(r, n // square)
+        split = min(top, r // p)
+        large[1:split + 1] -= large[p:split * p + 1:p] - c
+        if top > split:
+            large[split + 1:top + 1] -= small[quotients[split + 1:top + 1] // p] - c
+        if square <= r:
+            small[square:] -= small[values[square:] // p] - c
+    return int(large[1])
+
+
+def prime_count(n: int) -> int:
+    """Count the primes <= n without enumerating them (Lucy_Hedgehog, ~O(n^(3/4)))
+
+    The base primes up to sqrt(n) come from prime_cache, shared with find_primes.
+    """
+    if n < 2:
+        return 0
+    cached = prime_cache.count_upto(n)
+    if cached is not None:
+        return cached
+    base_primes = prime_cache.primes_between(2, isqrt(n) + 1, compact=True)
+    if np is not None and n < 1 << 62:
+        return _lucy_prime_count_numpy(n, base_primes)
+    return _lucy_prime_count(n, base_primes)
+
+
+def _lucy_prime_sum(n: int, base_primes: array) -> int:
+    """Lucy_Hedgehog DP for the sum of the primes <= n, in pure Python
+
+    As in _lucy_prime_count, but each surviving number is weighted by itself,
+    so striking the multiples of p removes p times the sums at n // (i * p).
+    """
+    r = isqrt(n)
+    small = [v * (v + 1) // 2 - 1 for v in range(r + 1)]
+    large = [0] + [(n // i) * (n // i + 1) // 2 - 1 for i in range(1, r + 1)]
+    for p in base_primes:
+        square = p * p
+        if square > n:
+            break
+        c = small[p - 1]
+        top = min(r, n // square)
+        split = min(top, r // p)
+        for i in range(1, split + 1):
+            large[i] -= p * (large[i * p] - c)
+        for i in range(split + 1, top + 1):
+            large[i] -= p * (small[n // (i * p)] - c)
+        for v in range(r, square - 1, -1):
+            small[v] -= p * (small[v // p] - c)
+    return large[1]
+
+
+def _lucy_prime_sum_numpy(n: int, base_primes: array, dtype) -> int:
+    """Vectorized _lucy_prime_sum in a fixed-width dtype
+
+    With uint64 the result is exact modulo 2**64, with float64 it is close;
+    prime_sum combines the two.
+    """
+    r = isqrt(n)
+    values = np.arange(r + 1, dtype=np.int64)
+    quotients = n // np.maximum(values, 1)
+
+    def triangular(v):
+        if dtype == np.float64:
+            v = v.astype(np.float64)
+            return v * (v + 1) / 2
+        v = v.astype(np.uint64)
+        one = np.uint64(1)
+        odd = v & one
+        return np.where(odd, v * ((v + one) >> one), (v >> one) * (v + one))
+
+    one = dtype(1)
+    small = triangular(values) - one
+    large = triangular(quotients) - one
+    for p in base_primes:
+        square = p * p
+        if square > n:
+            break
+        weight = dtype(p)
+        c = small[p - 1]
+        top = min(r, n // square)
+        split = min(top, r // p)
+        large[1:split + 1] -= weight * (large[p:split * p + 1:p] - c)
+        if top > split:
+            large[split + 1:top + 1] -= weight * (small[quotients[split + 1:top + 1] // p] - c)
+        if square <= r:
+            small[square:] -= weight * (small[values[square:] // p] - c)
+    return large[1]
+
+
+def prime_sum(n: int) -> int:
+    """Sum of the primes <= n without enumerating them (Lucy_Hedgehog, ~O(n^(3/4)))"""
+    if n < 2:
+        return 0
+    if n <= prime_cache.limit:
+        return sum(prime_cache.primes_between(2, n + 1, compact=True))
+    base_primes = prime_cache.primes_between(2, isqrt(n) + 1, compact=True)
+    # The float64 pass is accurate to far better than 2**63 up to here,
+    # which pins down the bits above the exact uint64 pass
+    if np is not None and n < 1 << 44:
+        low = int(_lucy_prime_sum_numpy(n, base_primes, np.uint64))
+        approx = float(_lucy_prime_sum_numpy(n, base_primes, np.float64))
+        return low + round((approx - low) / 2 ** 64) * 2 ** 64
+    return _lucy_prime_sum(n, base_primes)
+
+
+def _lucy_prime_count_mod(n: int, k: int, base_primes: array) -> List[int]:
+    """Lucy_Hedgehog DP with one count table per residue class mod k, in pure Python
+
+    Striking p * j moves the survivors j of class b out of class p * b mod k.
+    """
+    r = isqrt(n)
+
+    def initial(v: int, a: int) -> int:
+        # Numbers in [2, v] congruent to a mod k
+        return (v - a) // k + 1 - (a == 0) - (a == 1 % k)
+
+    small = [[initial(v, a) for v in range(r + 1)] for a in range(k)]
+    large = [[0] + [initial(n // i, a) for i in range(1, r + 1)] for a in range(k)]
+    for p in base_primes:
+        square = p * p
+        if square > n:
+            break
+        c = [row[p - 1] for row in small]
+        top = min(r, n // square)
+        split = min(top, r // p)
+        # Read every class before writing any, as the classes feed each other
+        deltas = [
+            [large[b][i * p] - c[b] for i in range(1, split + 1)]
+            + [small[b][n // (i * p)] - c[b] for i in range(split + 1, top + 1)]
+            for b in range(k)
+        ]
+        small_deltas = [[small[b][v // p] - c[b] for v in range(square, r + 1)] for b in range(k)]
+        for b in range(k):
+            a = p * b % k
+            row, delta = large[a], deltas[b]
+            for i in range(1, top + 1):
+                row[i] -= delta[i - 1]
+            row, delta = small[a], small_deltas[b]
+            for v in range(square, r + 1):
+                row[v] -= delta[v - square]
+    return [row[1] for row in large]
+
+
+def _lucy_prime_count_mod_numpy(n: int, k: int, base_primes: array) -> List[int]:
+    """Vectorized _lucy_prime_count_mod over a (k, sqrt(n)) table; n must stay inside int64"""
+    r = isqrt(n)
+    values = np.arange(r + 1, dtype=np.int64)
+    quotients = n // np.maximum(values, 1)
+    classes = np.arange(k, dtype=np.int64)[:, None]
+    corrections = (classes == 0).astype(np.int64) + (classes == 1 % k)
+    small = (values - classes) // k + 1 - corrections
+    large = (quotients - classes) // k + 1 - corrections
+    for p in base_primes:
+        square = p * p
+        if square > n:
+            break
+        c = small[:, p - 1:p].copy()
+        top = min(r, n // square)
+        split = min(top, r // p)
+        if k % p:
+            # p is invertible mod k: class a receives from class a / p
+            source = np.arange(k) * pow(p, -1, k) % k
+
+            def move(delta):
+                return delta[source]
+        else:
+            target = np.arange(k) * p % k
+
+            def move(delta):
+                moved = np.zeros_like(delta)
+                np.add.at(moved, target, delta)
+                return moved
+
+        large[:, 1:split + 1] -= move(large[:, p:split * p + 1:p] - c)
+        if top > split:
+            large[:, split + 1:top + 1] -= move(small[:, quotients[split + 1:top + 1] // p] - c)
+        if square <= r:
+            small[:, square:] -= move(small[:, values[square:] // p] - c)
+    return large[:, 1].tolist()
 
 
-def find_primes(limit: int) -> List[int]:
-    """Find all prime numbers up to the given limit"""
-    return [num for num in range(2, limit + 1) if is_prime(num)]
+def prime_count_mod(n: int, k: int) -> List[int]:
+    """Count the primes <= n in each residue class mod k, without enumerating them
+
+    Entry a of the result is the number of primes p <= n with p % k == a.
+    """
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    if n < 2:
+        return [0] * k
+    base_primes = prime_cache.primes_between(2, isqrt(n) + 1, compact=True)
+    if np is not None and n < 1 << 62:
+        return _lucy_prime_count_mod_numpy(n, k, base_primes)
+    return _lucy_prime_count_mod(n, k, base_primes)
+
+
+def nth_prime(k: int) -> int:
+    """Return the k-th prime, counting from nth_prime(1) == 2
+
+    The guess from Dusart's bounds is corrected with prime_count, and only the
+    short window between the corrected guess and the answer gets sieved.
+    """
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    if k < 6:
+        return (2, 3, 5, 7, 11)[k - 1]
+    log_k = log(k)
+    loglog_k = log(log_k)
+    # Dusart: k(ln k + ln ln k - 1) < p_k < k(ln k + ln ln k) for k >= 6
+    lower = int(k * (log_k + loglog_k - 1))
+    upper = int(k * (log_k + loglog_k))
+    if upper <= max(prime_cache.limit, 1 << 20):
+        return prime_cache.primes_between(2, upper + 1, compact=True)[k - 1]
+    guess = int(k * (log_k + loglog_k - 1 + (loglog_k - 2) / log_k))
+    count = prime_count(guess)
+    for _ in range(3):
+        if abs(k - count) < 1 << 10:
+            break
+        guess = min(max(guess + int((k - count) * log(guess)), lower), upper)
+        count = prime_count(guess)
+    if count < k:
+        for p in iter_primes(guess + 1):
+            count += 1
+            if count == k:
+                return p
+    # The answer is the back-th prime counting down from guess
+    back = count - k + 1
+    width = int(2 * back * log(guess)) + 1024
+    hi = guess + 1
+    while True:
+        window = list(iter_primes(hi - width, hi))
+        if len(window) >= back:
+            return window[-back]
+        back -= len(window)
+        hi -= width
+
+
+def _spf_table(limit: int) -> array:
+    """Smallest-prime-factor table up to limit; spf[p] == p for every prime p
+
+    Filled by slice assignment from the largest base prime down, so the
+    smallest prime dividing each number is written last.
+    """
+    spf = array('I', range(limit + 1))
+    for p in reversed(_small_primes(isqrt(limit))):
+        spf[p * p::p] = array('I', [p]) * len(range(p * p, limit + 1, p))
+    return spf
+
+
+# Bound of the shared smallest-prime-factor table used by factorize
+_SPF_LIMIT = 1 << 20
+_spf: Optional[array] = None
+
+
+def _pollard_brent(n: int) -> int:
+    """Find a non-trivial factor of the odd composite n with Brent's rho variant"""
+    for c in count(1):
+        y, r, q, g = 2, 1, 1, 1
+        x = ys = y
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(128, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd(q, n)
+                k += 128
+            r *= 2
+        if g == n:
+            # The batched gcd overshot; step back one value at a time
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd(abs(x - ys), n)
+        if g != n:
+            return g
+
+
+def _integer_root(n: int, k: int) -> int:
+    """Floor of the k-th root of n, by Newton's method on integers"""
+    x = 1 << -(-n.bit_length() // k)
+    while True:
+        y = ((k - 1) * x + n // x ** (k - 1)) // k
+        if y >= x:
+            return x
+        x = y
+
+
+def factorize(n: int) -> List[int]:
+    """Prime factors of n in ascending order, with multiplicity
+
+    Small n are read off a smallest-prime-factor table; larger n get trial
+    division by the small primes, then Pollard-Brent rho and Miller-Rabin.
+    """
+    global _spf
+    if n < 1:
+        raise ValueError("Can only factorize positive integers")
+    if n <= _SPF_LIMIT:
+        if _spf is None:
+            _spf = _spf_table(_SPF_LIMIT)
+        factors = []
+        while n > 1:
+            p = _spf[n]
+            factors.append(p)
+            n //= p
+        return factors
+    factors = []
+    for p in (2,) + _TRIAL_PRIMES:
+        if p * p > n:
+            break
+        while n % p == 0:
+            factors.append(p)
+            n //= p
+    pending = [n] if n > 1 else []
+    while pending:
+        m = pending.pop()
+        if is_prime(m):
+            factors.append(m)
+            continue
+        # Rho needs about sqrt(p) steps to split p**k, so peel perfect
+        # powers first; m has no factor below 1000, hence k < bits / 10
+        for k in _small_primes(m.bit_length() // 10):
+            root = _integer_root(m, k)
+            if root ** k == m:
+                pending += [root] * k
+                break
+        else:
+            d = _pollard_brent(m)
+            pending += [d, m // d]
+    return sorted(factors)
+
+
+def _factorize_window(lo: int, hi: int) -> List[List[int]]:
+    """Factor every number in [lo, hi) by dividing out the base primes up to isqrt(hi - 1)
+
+    Only the window is sieved, as in _sieve_segment; after the base primes,
+    whatever is left of a number is 1 or its single prime factor above the root.
+    """
+    size = hi - lo
+    rest = list(range(lo, hi))
+    factored: List[List[int]] = [[] for _ in range(size)]
+    for p in _small_primes(isqrt(hi - 1)):
+        for i in range((-lo) % p, size, p):
+            m = rest[i] // p
+            factors = factored[i]
+            factors.append(p)
+            while m % p == 0:
+                factors.append(p)
+                m //= p
+            rest[i] = m
+    for factors, m in zip(factored, rest):
+        if m > 1:
+            factors.append(m)
+    return factored
+
+
+def factorize_many(numbers: range, pause_gc: bool = False) -> List[List[int]]:
+    """Factor every number of a range in bulk
+
+    A dense range (its numbers fill at least 1/16 of [min, max]) that also
+    covers at least half of [1, max] is read off one smallest-prime-factor
+    table, where with a unit step each number reuses the factors of n // spf[n].
+    A dense range further out sieves only its own window, and a sparse one is
+    factorized number by number. Table and result are both held in memory:
+    range(1, 10**7) peaks at about 1.4 GB.
+
+    pause_gc=True disables the cyclic garbage collector for the duration,
+    which saves repeated full collections over millions of small lists but
+    affects every thread of the process.
+    """
+    if not numbers:
+        return []
+    lo, hi = min(numbers[0], numbers[-1]), max(numbers[0], numbers[-1])
+    if lo < 1:
+        raise ValueError("Can only factorize positive integers")
+    gc_was_enabled = pause_gc and gc.isenabled()
+    if gc_was_enabled:
+        gc.disable()
+    try:
+        span = hi - lo + 1
+        dense = span <= 16 * len(numbers)
+        if dense and hi <= 2 * span and hi < 1 << 32:
+            return _factorize_table(numbers)
+        # Sieving costs a few microseconds per number in the window plus the
+        # base primes; factorize costs upwards of a hundred per number
+        root = isqrt(hi)
+        if dense and root <= min(1000 * len(numbers), 1 << 24):
+            factored = _factorize_window(lo, hi + 1)
+            return [factored[m - lo] for m in numbers]
+        return [factorize(m) for m in numbers]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _factorize_table(numbers: range) -> List[List[int]]:
+    """factorize_many from a smallest-prime-factor table up to the range maximum"""
+    spf = _spf_table(max(numbers[0], numbers[-1]))
+    lo, chained = numbers.start, numbers.step == 1
+    factored: List[List[int]] = []
+    append = factored.append
+    for m in numbers:
+        p = spf[m]
+        rest = m // p
+        if chained and rest >= lo and m > 1:
+            append([p, *factored[rest - lo]])
+            continue
+        factors = []
+        while m > 1:
+            p = spf[m]
+            factors.append(p)
+            m //= p
+        append(factors)
+    return factored
+
+
+# ASCII characters that are neither alphanumeric nor whitespace
+_ASCII_PUNCTUATION = bytes(c for c in range(128) if not (chr(c).isalnum() or chr(c).isspace()))
+
+# Same set over all of Unicode: re's \w is str.isalnum() plus the underscore
+_NON_WORD_CHARS = re.compile(r'[^\w\s]|_')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words of text with everything but alphanumerics removed
+
+    Matches lower(), split() and dropping the non-alphanumeric characters
+    of each word, but does the removal in one pass over the whole text:
+    bytes.translate for pure ASCII text, a compiled regex otherwise.
+    """
+    if text.isascii():
+        stripped = text.encode('ascii').lower().translate(None, _ASCII_PUNCTUATION)
+        return stripped.decode('ascii').split()
+    return _NON_WORD_CHARS.sub('', text.lower()).split()
+
+
+def _count_words(text: str, word_dict: Counter) -> Counter:
+    """Add the counts of the words in text to word_dict"""
+    word_dict.update(tokenize(text))
+    return word_dict
 
 
 def word_count(text: str) -> Dict[str, int]:
     """Count occurrences of each word in text"""
-    words = text.lower().split()
-    word_dict = {}
-    for word in words:
-        # Remove punctuation
-        word = ''.join(char for char in word if char.isalnum())
-        if word:
-            word_dict[word] = word_dict.get(word, 0) + 1
-    return word_dict
+    return dict(_count_words(text, Counter()))
+
+
+def _whole_word_pieces(lines: Iterable[str]) -> Iterator[str]:
+    """Re-cut an iterable of strings so that no word spans two pieces
+
+    A word cut at the end of a piece is carried into the next one, so the
+    words of the pieces are exactly the words of ''.join(lines).
+    """
+    carry = ''
+    for piece in lines:
+        if carry:
+            piece = carry + piece
+        if piece and not piece[-1].isspace():
+            # The last word may continue in the next piece
+            parts = piece.rsplit(None, 1)
+            carry = parts[-1]
+            if len(parts) == 2:
+                yield parts[0]
+        else:
+            carry = ''
+            yield piece
+    if carry:
+        yield carry
+
+
+def word_count_stream(lines: Iterable[str]) -> Dict[str, int]:
+    """Count words over an iterable of strings, such as a text file, piece by piece
+
+    Only the counts and the current piece are held in memory; the counts
+    equal word_count(''.join(lines)).
+    """
+    word_dict = Counter()
+    for piece in _whole_word_pieces(lines):
+        _count_words(piece, word_dict)
+    return dict(word_dict)
+
+
+class WordCounter:
+    """Incremental, mergeable word counts with the tokenization of word_count
+
+    Counts only grow through update() and merge(); subtract() drops words
+    whose count falls to zero. Pickles as one newline-joined string of words
+    and one array of counts rather than a dict of small objects.
+    """
+
+    def __init__(self, text: str = ''):
+        self._counts = Counter()
+        if text:
+            self.update(text)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __getitem__(self, word: str) -> int:
+        return self._counts[word]
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._counts
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, WordCounter):
+            return self._counts == other._counts
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"WordCounter({len(self)} words, {self.total()} total)"
+
+    def total(self) -> int:
+        return sum(self._counts.values())
+
+    def update(self, text: str) -> 'WordCounter':
+        """Add the words of text"""
+        _count_words(text, self._counts)
+        return self
+
+    def update_stream(self, lines: Iterable[str]) -> 'WordCounter':
+        """Add the words of an iterable of strings, as word_count_stream reads them"""
+        for piece in _whole_word_pieces(lines):
+            _count_words(piece, self._counts)
+        return self
+
+    def merge(self, other: 'WordCounter') -> 'WordCounter':
+        """Add the counts of other in place, folding the smaller table into the larger"""
+        if len(other._counts) > len(self._counts):
+            merged = other._counts.copy()
+            merged.update(self._counts)
+            self._counts = merged
+        else:
+            self._counts.update(other._counts)
+        return self
+
+    def subtract(self, other: 'WordCounter') -> 'WordCounter':
+        """Remove the counts of other, dropping words that reach zero"""
+        counts = self._counts
+        for word, times in other._counts.items():
+            remaining = counts.get(word, 0) - times
+            if remaining > 0:
+                counts[word] = remaining
+            else:
+                counts.pop(word, None)
+        return self
+
+    def most_common(self, k: Optional[int] = None) -> List[Tuple[str, int]]:
+        return self._counts.most_common(k)
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(self._counts)
+
+    def __getstate__(self) -> Tuple[str, str, bytes]:
+        counts = self._counts
+        largest = max(counts.values(), default=0)
+        # Narrowest unsigned array type that holds every count
+        typecode = next(code for code in 'BHIQ' if largest < 1 << 8 * array(code).itemsize)
+        # Words never contain whitespace, so a newline separates them safely
+        return '\n'.join(counts), typecode, array(typecode, counts.values()).tobytes()
+
+    def __setstate__(self, state: Tuple[str, str, bytes]) -> None:
+        words, typecode, counts = state
+        values = array(typecode)
+        values.frombytes(counts)
+        self._counts = Counter(dict(zip(words.split('\n'), values))) if words else Counter()
+
+
+class Vocabulary:
+    """Interns each word to an integer id once and keeps the counts in an array('Q')
+
+    Words are numbered in order of first appearance; counts[i] belongs to
+    words[i]. After the first pass over a corpus, counting it again only
+    increments integers in the array.
+    """
+
+    def __init__(self, words: Iterable[str] = ()):
+        self.ids: Dict[str, int] = {}
+        self.words: List[str] = []
+        self.counts = array('Q')
+        for word in words:
+            self.intern(word)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.ids
+
+    def intern(self, word: str) -> int:
+        """Id of word, assigning the next free id the first time it is seen"""
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = self.ids[word] = len(self.words)
+            self.words.append(word)
+            self.counts.append(0)
+        return word_id
+
+    def encode(self, text: str) -> array:
+        """Ids of the words of text, tokenized as in word_count, interning new ones"""
+        ids, intern = self.ids, self.intern
+        return array('I', [ids[word] if word in ids else intern(word) for word in tokenize(text)])
+
+    def decode(self, word_ids: Iterable[int]) -> List[str]:
+        words = self.words
+        return [words[word_id] for word_id in word_ids]
+
+    def update(self, text: str) -> 'Vocabulary':
+        """Count the words of text"""
+        ids, counts, intern = self.ids, self.counts, self.intern
+        for word, times in Counter(tokenize(text)).items():
+            word_id = ids.get(word)
+            if word_id is None:
+                word_id = intern(word)
+            counts[word_id] += times
+        return self
+
+    def update_ids(self, word_ids: Iterable[int]) -> 'Vocabulary':
+        """Count already encoded words, with one bincount when NumPy is available
+
+        Raises IndexError, before counting anything, if an id is not in the
+        vocabulary.
+        """
+        size = len(self.words)
+        if np is not None:
+            if isinstance(word_ids, (np.ndarray, array, list, tuple)):
+                word_ids = np.asarray(word_ids, dtype=np.intp)
+            else:
+                word_ids = np.fromiter(word_ids, dtype=np.intp)
+            if word_ids.size:
+                if word_ids.min() < 0 or word_ids.max() >= size:
+                    raise IndexError(f"Word ids must lie in [0, {size})")
+                added = np.bincount(word_ids, minlength=size).astype(np.uint64)
+                counts = np.frombuffer(self.counts, dtype=np.uint64)
+                counts += added
+            return self
+        tally = Counter(word_ids)
+        if any(not 0 <= word_id < size for word_id in tally):
+            raise IndexError(f"Word ids must lie in [0, {size})")
+        counts = self.counts
+        for word_id, times in tally.items():
+            counts[word_id] += times
+        return self
+
+    def reset_counts(self) -> None:
+        """Zero every count but keep the vocabulary and its ids"""
+        self.counts = array('Q', bytes(8 * len(self.words)))
+
+    def to_dict(self) -> Dict[str, int]:
+        """Nonzero counts by word, as word_count would return them"""
+        return {word: times for word, times in zip(self.words, self.counts) if times}
+
+    def to_arrays(self):
+        """(words, counts) as NumPy arrays, index-aligned by word id
+
+        The words come back as an object array of the interned strings; a
+        fixed-width str array would pad every word to the longest one.
+        """
+        if np is None:
+            raise ImportError("Vocabulary.to_arrays requires NumPy")
+        words = np.empty(len(self.words), dtype=object)
+        words[:] = self.words
+        return words, np.array(self.counts, dtype=np.uint64)
+
+
+class HeavyHitters:
+    """Space-Saving counter: approximate word frequencies in a fixed number of slots
+
+    At most capacity words are tracked. A new word takes over the slot of
+    the smallest count m and starts from m + its count, with error m, so each
+    tracked word's true count lies in [count - error, count]. Every word
+    seen more than total / capacity times is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        # One (count, word) entry per tracked word; counts may be stale-low
+        self._heap: List[Tuple[int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, word: str, times: int = 1) -> None:
+        counts = self._counts
+        self.total += times
+        if word in counts:
+            counts[word] += times
+            return
+        if len(counts) < self.capacity:
+            counts[word] = times
+            self._errors[word] = 0
+            heapq.heappush(self._heap, (times, word))
+            return
+        heap = self._heap
+        while True:
+            smallest, victim = heap[0]
+            current = counts[victim]
+            if current == smallest:
+                break
+            heapq.heapreplace(heap, (current, victim))
+        del counts[victim], self._errors[victim]
+        counts[word] = smallest + times
+        self._errors[word] = smallest
+        heapq.heapreplace(heap, (smallest + times, word))
+
+    def update(self, text: str) -> None:
+        """Count the words of text, as word_count would tokenize them"""
+        add = self.add
+        for word, times in Counter(tokenize(text)).items():
+            add(word, times)
+
+    def top(self, k: int) -> List[Tuple[str, int, int]]:
+        """The k largest (word, count, error) entries, by estimated count"""
+        counts, errors = self._counts, self._errors
+        largest = heapq.nlargest(k, counts.items(), key=lambda item: item[1])
+        return [(word, times, errors[word]) for word, times in largest]
+
+    def is_exact_top(self, k: int) -> bool:
+        """Whether the words of top(k) are guaranteed to be the true top k words"""
+        entries = self.top(k + 1)
+        if len(entries) <= k:
+            return all(error == 0 for _, _, error in entries)
+        threshold = entries[k][1]
+        return all(count - error >= threshold for _, count, error in entries[:k])
+
+
+def word_count_top(lines: Iterable[str], k: int,
+                   capacity: Optional[int] = None) -> List[Tuple[str, int, int]]:
+    """Approximate top-k words of a stream in constant memory
+
+    Returns (word, count, error) tuples from a HeavyHitters counter with
+    capacity slots (default 10 * k); the true count is within error below count.
+    """
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    hitters = HeavyHitters(10 * k if capacity is None else capacity)
+    for piece in _whole_word_pieces(lines):
+        hitters.update(piece)
+    return hitters.top(k)
+
+
+# Whitespace bytes that are safe split points in UTF-8 text
+_ASCII_WHITESPACE = re.compile(rb'[\s\x1c-\x1f]')
+
+# Largest byte range one word_count_file task decodes at a time
+_WORD_COUNT_RANGE = 64 * 1024 * 1024
+
+
+def _count_file_range(path: str, start: int, stop: int) -> Counter:
+    """Worker: count the words of the UTF-8 bytes [start, stop) of a file via mmap"""
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return _count_words(mapped[start:stop].decode('utf-8'), Counter())
+
+
+def _file_ranges(path: str, parts: int) -> List[Tuple[int, int]]:
+    """Cut a file into about parts byte ranges, each ending at ASCII whitespace"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    step = min(-(-size // parts), _WORD_COUNT_RANGE)
+    ranges = []
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        start = 0
+        while start < size:
+            match = _ASCII_WHITESPACE.search(mapped, min(start + step, size))
+            stop = match.end() if match else size
+            ranges.append((start, stop))
+            start = stop
+    return ranges
+
+
+def _merge_counts(counts: Iterable[Counter]) -> Counter:
+    """Merge partial counters as they arrive, in a balanced tree
+
+    Works like a binary counter: a stack holds at most one merged counter
+    per rank, so only O(log n) partials are alive at any time.
+    """
+    stack: List[Tuple[int, Counter]] = []
+
+    def merge(left: Counter, right: Counter) -> Counter:
+        if len(left) < len(right):
+            left, right = right, left
+        left.update(right)
+        return left
+
+    for partial in counts:
+        rank = 0
+        while stack and stack[-1][0] == rank:
+            partial = merge(stack.pop()[1], partial)
+            rank += 1
+        stack.append((rank, partial))
+    merged = Counter()
+    while stack:
+        merged = merge(stack.pop()[1], merged)
+    return merged
+
+
+def _count_file_ranges(pool: ProcessPoolExecutor, path: str, ranges: List[Tuple[int, int]],
+                       workers: int) -> Iterator[Counter]:
+    """Count the ranges in the pool, yielding the partials in order
+
+    At most two ranges per worker are in flight, so finished partials do
+    not pile up in the parent faster than they are merged.
+    """
+    pending = deque()
+    for start, stop in ranges:
+        pending.append(pool.submit(_count_file_range, path, start, stop))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def word_count_file(path: Union[str, Path], workers: int = 1) -> Dict[str, int]:
+    """Count the words of a UTF-8 text file, like word_count on its contents
+
+    The file is cut into byte ranges that end at whitespace, so no word is
+    split. Each range is read through mmap, in a process pool when
+    workers > 1, and the partial counts are merged in a tree as they arrive.
+    """
+    path = str(path)
+    ranges = _file_ranges(path, 4 * max(workers, 1))
+    if workers <= 1:
+        return dict(_merge_counts(_count_file_range(path, start, stop) for start, stop in ranges))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(_merge_counts(_count_file_ranges(pool, path, ranges, workers)))
 
 
 def list_files(directory: str, extension: str = None) -> List[str]:
@@ -186,6 +1871,33 @@ def number_generator(start: int, end: int, step: int = 1):
         current += step
 
 
+def iter_primes(lo: int, hi: Optional[int] = None):
+    """Generator for the primes in [lo, hi), or from lo onwards when hi is None
+
+    Runs a segmented sieve that only keeps the base primes up to sqrt(hi), so
+    memory stays bounded by the segment size wherever the window starts.
+    """
+    if lo <= 2 and (hi is None or hi > 2):
+        yield 2
+    span = 2 * _SEGMENT_SIZE
+    base_limit, base_primes, base_sieved = 0, [], 0
+    seg_lo = max(lo, 3)
+    while hi is None or seg_lo < hi:
+        seg_hi = seg_lo + span if hi is None else min(seg_lo + span, hi)
+        while isqrt(seg_hi - 1) > base_limit:
+            # Unbounded streams grow their base primes by doubling
+            base_limit = isqrt(hi - 1) if hi is not None else max(isqrt(seg_hi - 1), 2 * base_limit)
+            # Far-out windows have many base primes; widen the segments so
+            # each one still strikes a segment several times
+            span = max(span, 8 * base_limit)
+            seg_hi = seg_lo + span if hi is None else min(seg_lo + span, hi)
+        if base_sieved != base_limit:
+            base_primes, base_sieved = _small_primes(base_limit)[1:], base_limit
+        flags = _sieve_segment(seg_lo, seg_hi, base_primes)
+        yield from compress(range(seg_lo | 1, seg_hi, 2), flags)
+        seg_lo = seg_hi
+
+
 # ============= DECORATORS =============
 
 def timer(func):